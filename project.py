@@ -1,32 +1,27 @@
 # Qubits and quantum algorithms simulator
+from functools import cache, lru_cache, reduce
+
 import numpy as np
+import opt_einsum as oe
+from numba import njit, prange
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.patches as patches
 from mpl_toolkits.mplot3d import Axes3D
 from pyfiglet import Figlet
 
-def create_qubit(state='0'):
-    """Create a qubit in the specified state ('0' or '1') or in a superposition state"""
-    if state == "0":
-        return np.array([1, 0])  # State |0>
-    elif state == "1":
-        return np.array([0, 1])  # State |1>
-    elif state == "+":
-        return np.array(
-            [1 / np.sqrt(2), 1 / np.sqrt(2)]
-        )  # Superposition state (|0> + |1> / sqrt(2))
-    elif state == "-":
-        return np.array(
-            [1 / np.sqrt(2), -1 / np.sqrt(2)]
-        )  # Superposition state (|0> - |1> / sqrt(2))
-    else:
-        raise ValueError("Unknown state: Use '0', '1', '+', or '-'")
-
-def apply_gate(qubit, gate):
-    """Apply a quantum gate to the qubit"""
-    # Define the basic quantum gates
-    gates = {
+# Basis and superposition states, built once at import in double precision and cast on use
+_KETS = {
+    "0": np.array([1, 0], dtype=np.complex128),  # State |0>
+    "1": np.array([0, 1], dtype=np.complex128),  # State |1>
+    "+": np.array([1, 1], dtype=np.complex128) / np.sqrt(2),  # Superposition state (|0> + |1> / sqrt(2))
+    "-": np.array([1, -1], dtype=np.complex128) / np.sqrt(2),  # Superposition state (|0> - |1> / sqrt(2))
+}
+
+# Define the basic quantum gates, kept in double precision as the reference for every simulation dtype
+_GATES = {
+    name: np.ascontiguousarray(matrix, dtype=np.complex128)
+    for name, matrix in {
         "H": np.array(
             [[1 / np.sqrt(2), 1 / np.sqrt(2)], [1 / np.sqrt(2), -1 / np.sqrt(2)]]
         ),  # Hadamard
@@ -34,88 +29,336 @@ def apply_gate(qubit, gate):
         "Z": np.array([[1, 0], [0, -1]]),  # Pauli Z
         "S": np.array([[1, 0], [0, 1j]]),  # Phase S
         "T": np.array([[1, 0], [0, np.exp(1j * np.pi / 4)]]),  # Phase T
-    }
+    }.items()
+}
+
+@cache
+def _ket_table(dtype=np.complex64):
+    """The _KETS table cast once per dtype, shared read-only"""
+    kets = {}
+    for name, ket in _KETS.items():
+        kets[name] = ket.astype(dtype)
+        kets[name].setflags(write=False)
+    return kets
+
+def _kets(states, dtype=np.complex64):
+    """Look up the vectors of several initial states with one table access each"""
+    kets = _ket_table(dtype)
+    try:
+        return [kets[state] for state in states]
+    except KeyError:
+        raise ValueError("Unknown state: Use '0', '1', '+', or '-'") from None
+
+def create_qubit(state='0', dtype=np.complex64):
+    """Create a qubit in the specified state ('0' or '1') or in a superposition state"""
+    return _kets([state], dtype)[0].copy()
+
+# CNOT as a (control_out, target_out, control_in, target_in) tensor for circuit contraction
+_CNOT_TENSOR = np.array([
+    [1, 0, 0, 0],
+    [0, 1, 0, 0],
+    [0, 0, 0, 1],
+    [0, 0, 1, 0]
+], dtype=np.complex128).reshape(2, 2, 2, 2)
+
+# Largest intermediate tensor (in elements) opt_einsum may build besides the state itself
+_CONTRACT_MEMORY_LIMIT = 2**20
+
+@cache
+def _gate_matrix(gate, dtype=np.complex64):
+    """Look up the 2x2 matrix of a named gate, cast once per dtype and shared read-only"""
+    try:
+        matrix = np.ascontiguousarray(_GATES[gate], dtype=dtype)
+    except KeyError:
+        raise ValueError('Unknown gate: Use "H", "X", "Z", "S", or "T"') from None
+    matrix.setflags(write=False)
+    return matrix
+
+def _qubit_index(qubit, num_qubits):
+    """Check a qubit index and map negative ones (-1 is the last qubit) onto 0..num_qubits-1"""
+    if not -num_qubits <= qubit < num_qubits:
+        raise ValueError(f"Qubit index {qubit} out of range for {num_qubits} qubits")
+    return qubit % num_qubits
 
-    if gate not in gates:
-        raise ValueError('Unknown gate: Use "H", "X", "Z", "S", or "T"')
+def apply_gate(qubit, gate):
+    """Apply a quantum gate to the qubit"""
+    qubit = np.asarray(qubit)
+    return _gate_matrix(gate, np.result_type(qubit.dtype, np.complex64)) @ qubit
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _apply_1q_kernel(state, u00, u01, u10, u11, stride):
+    """Update every amplitude pair (i, i + stride) whose target bit is 0 and 1"""
+    for pair in prange(state.shape[0] // 2):
+        # Insert a 0 at the target bit of the pair number to get the lower index
+        i = ((pair & ~(stride - 1)) << 1) | (pair & (stride - 1))
+        j = i | stride
+        a = state[i]
+        b = state[j]
+        state[i] = u00 * a + u01 * b
+        state[j] = u10 * a + u11 * b
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _apply_phase_kernel(state, phase, stride):
+    """Multiply every amplitude whose target bit is 1 by the phase, leaving the others untouched"""
+    for pair in prange(state.shape[0] // 2):
+        j = ((pair & ~(stride - 1)) << 1) | stride | (pair & (stride - 1))
+        state[j] *= phase
+
+@njit(parallel=True, cache=True)
+def _apply_cnot_kernel(state, control_mask, target_mask):
+    """Swap every amplitude pair whose control bit is 1 and whose target bits differ"""
+    for pair in prange(state.shape[0] // 2):
+        i = ((pair & ~(target_mask - 1)) << 1) | (pair & (target_mask - 1))
+        if i & control_mask:
+            j = i | target_mask
+            state[i], state[j] = state[j], state[i]
+
+def _as_state(state, num_qubits):
+    """Make the state a contiguous complex buffer the kernels can update in place"""
+    # The kernels do no bounds checking, so the buffer must hold exactly 2**n amplitudes
+    if state.shape != (1 << num_qubits,):
+        raise ValueError(f"State vector of shape {state.shape} does not match {num_qubits} qubits")
+    dtype = np.result_type(state.dtype, np.complex64)
+    if not state.flags.writeable:
+        return np.array(state, dtype=dtype, copy=True)  # Read-only arrays (e.g. the shared tables) get a private copy
+    return np.ascontiguousarray(state, dtype=dtype)
+
+def apply_1q(state, gate_matrix, target, num_qubits):
+    """Apply a 2x2 gate matrix to the target qubit of the full state vector and return the new state
+
+    Always use the returned array. A contiguous complex state is updated in place, any other state is
+    first copied into a complex buffer, so do not rely on the input array being modified or left alone.
+    """
+    target = _qubit_index(target, num_qubits)
+    state = _as_state(state, num_qubits)
+    gate_matrix = np.asarray(gate_matrix).astype(state.dtype, copy=False)  # Never upcast the state
+    if gate_matrix[0, 1] == 0 and gate_matrix[1, 0] == 0 and gate_matrix[0, 0] == 1:
+        # Phase gates (Z, S, T and their products) only scale the half of the state whose target bit is 1
+        if gate_matrix[1, 1] != 1:
+            _apply_phase_kernel(state, gate_matrix[1, 1], 1 << (num_qubits - 1 - target))
+        return state
+    # One O(2**n) pass over the amplitude pairs instead of a 2**n x 2**n operator
+    _apply_1q_kernel(
+        state, gate_matrix[0, 0], gate_matrix[0, 1], gate_matrix[1, 0], gate_matrix[1, 1],
+        1 << (num_qubits - 1 - target),
+    )
+    return state
+
+def fuse(gates_sequence, dtype=np.complex64, num_qubits=None):
+    """Merge runs of single-qubit gates on the same qubit into one 2x2 matrix and drop repeated CNOTs
+
+    With num_qubits given, qubit indices are checked and negative ones mapped to 0..num_qubits-1.
+    """
+    def index(qubit_idx):
+        return qubit_idx if num_qubits is None else _qubit_index(qubit_idx, num_qubits)
+
+    fused = []
+    pending = {}  # qubit index -> product of the gates applied to it since its last CNOT
+
+    def flush(qubit_idx):
+        if qubit_idx in pending:
+            fused.append((qubit_idx, pending.pop(qubit_idx)))
+            return True
+        return False
 
-    return np.dot(gates[gate], qubit)
+    for operation in gates_sequence:
+        if len(operation) == 2:
+            qubit_idx, gate = index(operation[0]), operation[1]
+            gate_matrix = _gate_matrix(gate, dtype)
+            # Gates on different qubits commute, so only a CNOT on this qubit can interrupt the run
+            pending[qubit_idx] = gate_matrix @ pending[qubit_idx] if qubit_idx in pending else gate_matrix
+        elif len(operation) == 3 and operation[0] == 'CNOT':
+            control, target = index(operation[1]), index(operation[2])
+            flushed_control = flush(control)
+            flushed_target = flush(target)
+            if not (flushed_control or flushed_target) and fused and fused[-1] == ('CNOT', control, target):
+                fused.pop()  # Two identical CNOTs in a row cancel out
+            else:
+                fused.append(('CNOT', control, target))
+        else:
+            raise ValueError("Unknown or unsupported gate")
 
-def simulate_circuit(initial_states, gates_sequence):
-    qubits = [create_qubit(state) for state in initial_states]
-    print(f"Initial state of Qubits: {qubits}")
+    for qubit_idx in sorted(pending):
+        flush(qubit_idx)
+
+    return fused
+
+@lru_cache(maxsize=128)
+def _circuit_expression(num_qubits, wiring):
+    """Build the opt_einsum expression for a circuit shape, given the qubits each gate acts on"""
+    # Every qubit wire carries an index label, and each gate consumes the current labels and creates new ones
+    labels = list(range(num_qubits))
+    next_label = num_qubits
+    terms = [list(labels)]
+    shapes = [(2,) * num_qubits]
+
+    for wires in wiring:
+        new_labels = list(range(next_label, next_label + len(wires)))
+        terms.append(new_labels + [labels[wire] for wire in wires])
+        shapes.append((2,) * (2 * len(wires)))
+        for wire, label in zip(wires, new_labels):
+            labels[wire] = label
+        next_label += len(wires)
+
+    subscripts = ','.join(''.join(map(oe.get_symbol, term)) for term in terms)
+    subscripts += '->' + ''.join(map(oe.get_symbol, labels))
+    # The contraction path is searched once here and reused by every circuit with the same shape
+    return oe.contract_expression(
+        subscripts, *shapes, optimize='auto-hq', memory_limit=max(_CONTRACT_MEMORY_LIMIT, 1 << num_qubits)
+    )
+
+def contract_circuit(state, operations, num_qubits):
+    """Apply a fused gate sequence (see fuse) to the state as one tensor network contraction"""
+    wiring = []
+    tensors = []
+    for operation in operations:
+        if len(operation) == 2:
+            qubit_idx, gate_matrix = operation
+            wiring.append((_qubit_index(qubit_idx, num_qubits),))
+            tensors.append(np.asarray(gate_matrix).astype(state.dtype, copy=False))
+        elif len(operation) == 3 and operation[0] == 'CNOT':
+            control, target = _qubit_index(operation[1], num_qubits), _qubit_index(operation[2], num_qubits)
+            if control == target:
+                raise ValueError("CNOT control and target must be different qubits")
+            wiring.append((control, target))
+            tensors.append(_CNOT_TENSOR.astype(state.dtype))
+        else:
+            raise ValueError("Unknown or unsupported gate")
 
-    for operation in gates_sequence:
+    # opt_einsum picks the pairwise order, e.g. multiplying small gates together before they meet the state
+    expression = _circuit_expression(num_qubits, tuple(wiring))
+    return expression(state.reshape((2,) * num_qubits), *tensors).reshape(-1)
+
+def kron_vectors(vectors):
+    """Kronecker product of several qubit vectors, as a fresh writable array"""
+    if not vectors:
+        raise ValueError("At least one qubit is required")
+    # The copy keeps a single vector from aliasing the shared ket table; np.kron always allocates anyway
+    return reduce(np.kron, vectors[1:], np.array(vectors[0], copy=True))
+
+def simulate_circuit(initial_states, gates_sequence, dtype=np.complex64, method='statevector', verbose=False):
+    """Simulate the circuit on a single state vector of 2**n amplitudes (qubit 0 is the leftmost bit)
+
+    method='statevector' applies the gates one by one, method='tensornetwork' contracts the whole circuit at once.
+    verbose=True prints the state vector after each step (formatting it costs O(2**n) per print).
+    """
+    # Single precision by default: half the memory traffic per amplitude, pass complex128 for more accuracy
+    if method not in ('statevector', 'tensornetwork'):
+        raise ValueError("Unknown method: Use 'statevector' or 'tensornetwork'")
+    num_qubits = len(initial_states)
+    state = kron_vectors(_kets(initial_states, dtype))
+    if verbose:
+        print(f"Initial state vector: {state}")
+
+    # Runs of gates on one qubit are applied as a single pass over the state
+    operations = fuse(gates_sequence, dtype, num_qubits)
+    if method == 'tensornetwork':
+        state = contract_circuit(state, operations, num_qubits)
+        if verbose:
+            print(f"State vector after contracting the circuit: {state}")
+        return state
+
+    for operation in operations:
         if len(operation) == 2:
-            qubit_idx, gate = operation
-            qubits[qubit_idx] = apply_gate(qubits[qubit_idx], gate)
-            print(f"State of qubit {qubit_idx} after applying the gate '{gate}': {qubits[qubit_idx]}")
+            qubit_idx, gate_matrix = operation
+            state = apply_1q(state, gate_matrix, qubit_idx, num_qubits)
+            if verbose:
+                print(f"State vector after applying the fused gates to qubit {qubit_idx}: {state}")
         elif len(operation) == 3 and operation[0] == 'CNOT':
             control, target = operation[1], operation[2]
-            qubits = apply_cnot(qubits, control, target)
-            print(f"State of qubits after the CNOT gate (qubit {control} -> qubit {target}): {qubits}")
+            state = apply_cnot(state, control, target, num_qubits)
+            if verbose:
+                print(f"State vector after the CNOT gate (qubit {control} -> qubit {target}): {state}")
         else:
             raise ValueError("Unknown or unsupported gate")
 
-    return qubits
-
-def apply_cnot(qubits, control, target):
-    """CNOT matrix for two qubits"""
-    if len(qubits) < 2:
-        raise ValueError("CNOT requires at least 2 qubits")
+    return state
 
-    # Convert qubits into four-dimensional state vectors
-    state_vector = np.kron(qubits[control], qubits[target])
+def apply_cnot(state, control, target, num_qubits):
+    """Apply a CNOT gate to the full state vector and return the new state
 
-    cnot_matrix = np.array([
-        [1, 0, 0, 0],
-        [0, 1, 0, 0],
-        [0, 0, 0, 1],
-        [0, 0, 1, 0]
-    ])
+    Like apply_1q, always use the returned array: the input may or may not be updated in place.
+    """
+    if num_qubits < 2:
+        raise ValueError("CNOT requires at least 2 qubits")
+    control, target = _qubit_index(control, num_qubits), _qubit_index(target, num_qubits)
+    if control == target:
+        raise ValueError("CNOT control and target must be different qubits")
 
-    # Apply the CNOT gate
-    new_state_vector = np.dot(cnot_matrix, state_vector)
+    # CNOT is a permutation of the amplitudes: swap each pair instead of multiplying by a matrix
+    state = _as_state(state, num_qubits)
+    _apply_cnot_kernel(state, 1 << (num_qubits - 1 - control), 1 << (num_qubits - 1 - target))
 
-    # Split the resulting vector back into two qubits
-    qubits[control] = new_state_vector[:2]
-    qubits[target] = new_state_vector[2:]
+    return state
 
-    return qubits
+# Compile the kernels for both simulation dtypes at import rather than inside the first circuit
+for _dtype in (np.complex64, np.complex128):
+    apply_1q(np.zeros(4, dtype=_dtype), _GATES["H"], 0, 2)
+    apply_1q(np.zeros(4, dtype=_dtype), _GATES["Z"], 0, 2)
+    apply_cnot(np.zeros(4, dtype=_dtype), 0, 1, 2)
 
 """PART FOR VISUALIZATION"""
 
-def calculate_probabilities(qubits):
-    """Calculate the probabilities of each state after applying gates"""
-    if len(qubits) == 1:
-        state_vector = qubits[0]
-    else:
-        state_vector = qubits[0]
-        for qubit in qubits[1:]:
-            state_vector = np.kron(state_vector, qubit)
-
-    probabilities = np.abs(state_vector) ** 2  # Square of amplitude to get probabilities
+def calculate_probabilities(state):
+    """Calculate the probabilities of each basis state of the state vector"""
+    # Square of amplitude to get probabilities, written into one buffer without temporaries
+    probabilities = np.empty(state.shape[0], dtype=np.float64)
+    np.abs(state, out=probabilities)
+    np.square(probabilities, out=probabilities)
     return probabilities
 
-def plot_histogram_to_pdf(probabilities, num_qubits, pdf):
-    """Save the complete histogram of probabilities into a single PDF page."""
-    fig, ax = plt.subplots()
-    states = [f"|{bin(i)[2:].zfill(num_qubits)}>" for i in range(2**num_qubits)]
+def sample(state, shots, rng=None):
+    """Measure the state `shots` times and return the index of the basis state observed each time"""
+    rng = rng or np.random.default_rng()
+    probabilities = calculate_probabilities(state)
+    probabilities /= probabilities.sum()  # Absorb the rounding drift of single-precision states
+    # One vectorized draw for every shot instead of a Python loop
+    return rng.choice(probabilities.size, size=shots, p=probabilities)
+
+def outcome_bits(outcomes, num_qubits):
+    """Unpack basis state indices into one row of qubit values per shot (qubit 0 first)"""
+    outcomes = np.asarray(outcomes)
+    return ((outcomes[:, None] >> np.arange(num_qubits - 1, -1, -1)) & 1).astype(np.uint8)
+
+# Density matrices of the named single-qubit states, rounded so nearby simulation results hash to the same key
+_KET_LABELS = {
+    tuple(np.round(np.outer(ket, ket.conj()), 6).view(np.float64).ravel().tolist()): f"|{name}>"
+    for name, ket in _KETS.items()
+}
+
+def ket_label(qubit):
+    """Return '|0>', '|1>', '|+>' or '|->' for a matching 2x2 density matrix, None otherwise"""
+    key = np.round(np.asarray(qubit, dtype=np.complex128), 6).view(np.float64).ravel()
+    return _KET_LABELS.get(tuple(key.tolist()))
+
+def reduced_density_matrix(state, qubit, num_qubits):
+    """Trace out every other qubit and return the 2x2 density matrix of one qubit"""
+    tensor = np.moveaxis(state.reshape((2,) * num_qubits), qubit, 0).reshape(2, -1)
+    return tensor @ tensor.conj().T
+
+def basis_labels(num_qubits):
+    """Ket labels of the 2**n basis states, in state vector order (e.g. '|01>')"""
+    return [f"|{i:0{num_qubits}b}>" for i in range(1 << num_qubits)]
+
+def plot_histogram_to_pdf(probabilities, labels, pdf, ax):
+    """Save the complete histogram of probabilities into a single PDF page, drawn on a reused 2D axes."""
+    ax.clear()
 
     # Plot the probabilities for all states
-    bars = ax.bar(states, probabilities)
+    bars = ax.bar(labels, probabilities)
     ax.set_xlabel('States')
     ax.set_ylabel('Probabilities')
     ax.set_title('Histogram of Quantum State Probabilities')
 
     # Save the current figure to the PDF
-    pdf.savefig(fig)
-    plt.close(fig)  # Close the figure to free memory
-
-def draw_circuit(gates_sequence, num_qubits, pdf):
-    """Draw a basic Quantum circuit"""
-
-    fig, ax = plt.subplots(figsize=(10, num_qubits))
+    pdf.savefig(ax.figure)
+
+def draw_circuit(gates_sequence, num_qubits, pdf, ax):
+    """Draw a basic Quantum circuit on a reused 2D axes"""
+    ax.clear()
+    fig = ax.figure
+    page_size = fig.get_size_inches()
+    fig.set_size_inches(10, num_qubits)
     ax.set_xlim(0, len(gates_sequence) + 1)
     ax.set_ylim(-1, num_qubits)
 
@@ -136,44 +379,46 @@ def draw_circuit(gates_sequence, num_qubits, pdf):
             ax.vlines(x=idx, ymin=min(control, target), ymax=max(control, target), color='black')
             ax.text(idx, target, 'X', fontsize=12, va='center', ha='center', bbox=dict(boxstyle="circle,pad=0.3", fc="lightblue", ec="black"))
 
-        ax.axis('off')
-        pdf.savefig(fig)
-        plt.close(fig)  # Close the figure to free memory
+    # Save the finished circuit once, as a single page
+    ax.axis('off')
+    pdf.savefig(fig)
+    fig.set_size_inches(page_size)  # Give the shared figure back its size for the next page
 
-def plot_bloch_vector(qubit, pdf):
-    """ Display the state of a qubit on the Bloch sphere """
-    theta = 2 * np.arccos(qubit[0])
-    phi = np.angle(qubit[1])
+# Bloch sphere surface, meshed once: 40x40 is indistinguishable from finer meshes at PDF resolution
+_U, _V = np.meshgrid(np.linspace(0, 2 * np.pi, 40), np.linspace(0, np.pi, 40))
+_SPHERE_X, _SPHERE_Y, _SPHERE_Z = np.cos(_U) * np.sin(_V), np.sin(_U) * np.sin(_V), np.cos(_V)
 
-    x = np.sin(theta) * np.cos(phi)
-    y = np.sin(theta) * np.sin(phi)
-    z = np.cos(theta)
+def plot_bloch_vector(qubit, pdf, ax):
+    """ Display the state of a qubit, given as its 2x2 density matrix, on the Bloch sphere drawn on a reused 3D axes """
+    # Entangled qubits are mixed states and end up inside the sphere
+    x = 2 * qubit[1, 0].real
+    y = 2 * qubit[1, 0].imag
+    z = (qubit[0, 0] - qubit[1, 1]).real
 
-    fig = plt.figure()
-    ax = fig.add_subplot(111, projection='3d')
+    ax.clear()
     ax.quiver(0, 0, 0, x, y, z, color='blue', linewidth=3)
 
     # Draw the sphere
-    u = np.linspace(0, 2 * np.pi, 100)
-    v = np.linspace(0, np.pi, 100)
-    x = np.outer(np.cos(u), np.sin(v))
-    y = np.outer(np.sin(u), np.sin(v))
-    z = np.outer(np.ones(np.size(u)), np.cos(v))
-
-    ax.plot_surface(x, y, z, color='lightgrey', alpha=0.3)
+    ax.plot_surface(_SPHERE_X, _SPHERE_Y, _SPHERE_Z, color='lightgrey', alpha=0.3)
 
     ax.set_xlabel('X')
     ax.set_ylabel('Y')
     ax.set_zlabel('Z')
     ax.set_title('Bloch Sphere')
 
-    pdf.savefig(fig)
-    plt.close(fig)  # Close the figure to free memory
+    pdf.savefig(ax.figure)
+
+_BANNER = None
+
+def _banner():
+    """Render the title banner once, since loading a Figlet font reads and parses the font file"""
+    global _BANNER
+    if _BANNER is None:
+        _BANNER = Figlet(font="doom").renderText("Quantum Simulator")
+    return _BANNER
 
 def main():
-    figlet = Figlet()
-    figlet.setFont(font="doom")
-    print(figlet.renderText("Quantum Simulator"))
+    print(_banner())
 
     # Ask the user to enter the initial states of the qubits
     initial_states = input("Enter the initial states of the qubits (e.g., 0, +, 1, -) separated by commas: ").split(',')
@@ -214,42 +459,44 @@ def main():
         pdf_filename = "quantum_simulation_results.pdf"
 
     # Simulate the circuit with the user inputs
-    final_qubits = simulate_circuit(initial_states, gates_sequence)
+    final_state = simulate_circuit(initial_states, gates_sequence, verbose=True)
     num_qubits = len(initial_states)
-    probabilities = calculate_probabilities(final_qubits)
+    probabilities = calculate_probabilities(final_state)
+    labels = basis_labels(num_qubits)  # Shared by the histogram and the probabilities page
+    final_qubits = [reduced_density_matrix(final_state, i, num_qubits) for i in range(num_qubits)]
 
     # Convert the final states to ket notation for display
     print("Final state after applying all gates:")
     for qubit in final_qubits:
-        if np.array_equal(qubit, np.array([1, 0])):
-            print("|0>")
-        elif np.array_equal(qubit, np.array([0, 1])):
-            print("|1>")
-        elif np.array_equal(qubit, np.array([1/np.sqrt(2), 1/np.sqrt(2)])):
-            print("|+>")
-        elif np.array_equal(qubit, np.array([1/np.sqrt(2), -1/np.sqrt(2)])):
-            print("|->")
+        label = ket_label(qubit)
+        if label is not None:
+            print(label)
         else:
-            print("Unknown state:", qubit)
+            print("Unknown or entangled state:", qubit)
 
     # Generate and save the plots and numerical values in a PDF file
+    # One figure per kind of page, cleared and redrawn for each page instead of created and destroyed
+    fig_2d, ax_2d = plt.subplots()
+    fig_3d = plt.figure()
+    ax_3d = fig_3d.add_subplot(111, projection='3d')
     with PdfPages(pdf_filename) as pdf:
-        plot_histogram_to_pdf(probabilities, num_qubits, pdf)
-        draw_circuit(gates_sequence, num_qubits, pdf)
+        plot_histogram_to_pdf(probabilities, labels, pdf, ax_2d)
+        draw_circuit(gates_sequence, num_qubits, pdf, ax_2d)
         for qubit in final_qubits:
-            plot_bloch_vector(qubit, pdf)
+            plot_bloch_vector(qubit, pdf, ax_3d)
 
         # Add the numerical values of the probabilities in the PDF
-        fig, ax = plt.subplots()
-        ax.axis('off')
+        ax_2d.clear()
+        ax_2d.axis('off')
         text_str = "Probabilities of states:\n"
-        states = [f"|{bin(i)[2:].zfill(num_qubits)}>" for i in range(2**num_qubits)]
-        for state, prob in zip(states, probabilities):
-            text_str += f"{state}: {prob:.4f}\n"
+        text_str += "".join(f"{label}: {prob:.4f}\n" for label, prob in zip(labels, probabilities))
+
+        ax_2d.text(0.5, 0.5, text_str, transform=ax_2d.transAxes, fontsize=12, verticalalignment='center', horizontalalignment='center')
+        pdf.savefig(fig_2d)
 
-        ax.text(0.5, 0.5, text_str, transform=ax.transAxes, fontsize=12, verticalalignment='center', horizontalalignment='center')
-        pdf.savefig(fig)
-        plt.close(fig)
+    # Close the shared figures once every page is written
+    plt.close(fig_2d)
+    plt.close(fig_3d)
 
     print(f"Simulation complete. The results have been saved in '{pdf_filename}'.")
 
@@ -3,9 +3,18 @@ import pytest
 from project import (
     create_qubit,
     apply_gate,
+    apply_1q,
+    fuse,
     simulate_circuit,
     apply_cnot,
+    contract_circuit,
+    kron_vectors,
     calculate_probabilities,
+    reduced_density_matrix,
+    basis_labels,
+    ket_label,
+    sample,
+    outcome_bits,
 )
 
 def test_create_qubit():
@@ -27,6 +36,10 @@ def test_create_qubit():
     expected_minus = np.array([1 / np.sqrt(2), -1 / np.sqrt(2)])
     assert np.allclose(qubit_minus, expected_minus, atol=1e-8)
 
+    # Each call returns a fresh array, so mutating one qubit never leaks into the next
+    qubit_0[0] = 0
+    assert np.array_equal(create_qubit('0'), np.array([1, 0]))
+
     # Test invalid state
     with pytest.raises(ValueError):
         create_qubit('invalid')
@@ -49,39 +62,236 @@ def test_apply_gate():
     expected_z = np.array([1, 0])
     assert np.array_equal(qubit_z, expected_z)
 
+    # Test phase S gate on |1>
+    qubit_s = apply_gate(create_qubit('1'), 'S')
+    assert np.allclose(qubit_s, np.array([0, 1j]))
+
     # Test invalid gate
     with pytest.raises(ValueError):
         apply_gate(qubit, 'invalid')
 
+def test_apply_1q():
+    # X on qubit 1 of |00> gives |01>, on qubit 0 gives |10>
+    state = np.kron(create_qubit('0'), create_qubit('0')).astype(complex)
+    x = np.array([[0, 1], [1, 0]])
+    assert np.allclose(apply_1q(state.copy(), x, 1, 2), np.array([0, 1, 0, 0]))
+    assert np.allclose(apply_1q(state.copy(), x, 0, 2), np.array([0, 0, 1, 0]))
+
+    # Matches the full Kronecker-expanded operator on a random 3-qubit state
+    rng = np.random.default_rng(0)
+    state = rng.normal(size=8) + 1j * rng.normal(size=8)
+    h = np.array([[1, 1], [1, -1]]) / np.sqrt(2)
+    expected = np.kron(np.kron(np.eye(2), h), np.eye(2)) @ state
+    assert np.allclose(apply_1q(state, h, 1, 3), expected)
+
+    # Diagonal phase gates take a fast path that must agree with the full operator too
+    t_gate = np.array([[1, 0], [0, np.exp(1j * np.pi / 4)]])
+    expected = np.kron(np.kron(t_gate, np.eye(2)), np.eye(2)) @ state
+    assert np.allclose(apply_1q(state.copy(), t_gate, 0, 3), expected)
+    expected = np.kron(np.eye(4), np.diag([1, -1])) @ state
+    assert np.allclose(apply_1q(state.copy(), np.diag([1, -1]), 2, 3), expected)
+    assert np.allclose(apply_1q(state.copy(), np.eye(2), 1, 3), state)
+
+    # Read-only states are copied rather than handed to the kernels, on every kernel path
+    read_only = np.array([1, 0, 0, 0], dtype=complex)
+    read_only.setflags(write=False)
+    assert np.allclose(apply_1q(read_only, h, 0, 2), np.array([1, 0, 1, 0]) / np.sqrt(2))
+    assert np.allclose(apply_1q(read_only, np.diag([1, -1]), 0, 2), read_only)
+    flipped = np.array([0, 0, 1, 0], dtype=complex)
+    flipped.setflags(write=False)
+    assert np.allclose(apply_cnot(flipped, 0, 1, 2), np.array([0, 0, 0, 1]))
+    assert np.array_equal(read_only, np.array([1, 0, 0, 0]))
+    assert np.array_equal(flipped, np.array([0, 0, 1, 0]))
+
+    # Real-valued input is promoted to complex instead of truncating the result
+    s = np.array([[1, 0], [0, 1j]])
+    assert np.allclose(apply_1q(np.array([0.0, 1.0]), s, 0, 1), np.array([0, 1j]))
+
 def test_apply_cnot():
-    qubit_0 = create_qubit('0')
-    qubit_1 = create_qubit('1')
+    # |01>: control qubit 0 is |0>, so the target is left untouched
+    state = np.kron(create_qubit('0'), create_qubit('1')).astype(complex)
+    new_state = apply_cnot(state, 0, 1, 2)
+    assert np.allclose(new_state, np.array([0, 1, 0, 0]))
 
-    # Apply CNOT gate with qubit 0 as control and qubit 1 as target
-    qubits = [qubit_0, qubit_1]
-    new_qubits = apply_cnot(qubits, 0, 1)
-    expected = [np.array([1, 0]), np.array([1, 0])]  # CNOT with control=0, target=1 should flip target if control is 1
-    assert all(np.allclose(q, e, atol=10) for q, e in zip(new_qubits, expected)) # TODO: Remove atol
+    # |10>: control qubit 0 is |1>, so the target flips to give |11>
+    state = np.kron(create_qubit('1'), create_qubit('0')).astype(complex)
+    new_state = apply_cnot(state, 0, 1, 2)
+    assert np.allclose(new_state, np.array([0, 0, 0, 1]))
+
+    # Control below the target: |01> with control=1, target=0 gives |11>
+    state = np.kron(create_qubit('0'), create_qubit('1')).astype(complex)
+    new_state = apply_cnot(state, 1, 0, 2)
+    assert np.allclose(new_state, np.array([0, 0, 0, 1]))
+
+    with pytest.raises(ValueError):
+        apply_cnot(np.array([1, 0], dtype=complex), 0, 0, 1)
 
 def test_calculate_probabilities():
-    qubit_0 = create_qubit('0')
-    qubit_1 = create_qubit('1')
+    state = np.kron(create_qubit('0'), create_qubit('1'))
+    probs = calculate_probabilities(state)
+    expected_probs = np.array([0.0, 1.0, 0.0, 0.0])  # For |01> the probabilities are [0, 1, 0, 0]
+    assert np.allclose(probs, expected_probs)
+
+def test_basis_labels():
+    assert basis_labels(1) == ['|0>', '|1>']
+    assert basis_labels(2) == ['|00>', '|01>', '|10>', '|11>']
+
+def test_sample():
+    # A Bell pair only ever measures |00> or |11>, roughly half the time each
+    bell = simulate_circuit(['0', '0'], [(0, 'H'), ('CNOT', 0, 1)])
+    outcomes = sample(bell, 10000, rng=np.random.default_rng(0))
+    assert outcomes.shape == (10000,)
+    assert set(np.unique(outcomes)) == {0, 3}
+    assert abs(np.mean(outcomes == 3) - 0.5) < 0.05
+
+    # Seeded generators give reproducible shots
+    assert np.array_equal(sample(bell, 10, rng=np.random.default_rng(1)), sample(bell, 10, rng=np.random.default_rng(1)))
+
+def test_outcome_bits():
+    bits = outcome_bits(np.array([0, 1, 6]), 3)
+    assert bits.dtype == np.uint8
+    assert np.array_equal(bits, np.array([[0, 0, 0], [0, 0, 1], [1, 1, 0]]))
+
+def test_ket_label():
+    # Named states are recognized from a single-precision simulation, whatever their global phase
+    state = simulate_circuit(['0', '1'], [(0, 'H'), (1, 'H'), (1, 'S'), (1, 'S')])
+    assert ket_label(reduced_density_matrix(state, 0, 2)) == '|+>'
+    assert ket_label(reduced_density_matrix(state, 1, 2)) == '|+>'
+    assert ket_label(np.outer(create_qubit('1'), create_qubit('1'))) == '|1>'
+
+    # Entangled qubits are mixed and have no ket
+    bell = simulate_circuit(['0', '0'], [(0, 'H'), ('CNOT', 0, 1)])
+    assert ket_label(reduced_density_matrix(bell, 0, 2)) is None
+
+def test_reduced_density_matrix():
+    # Product state |0+>: each qubit keeps its own pure state
+    state = np.kron(create_qubit('0'), create_qubit('+'))
+    assert np.allclose(reduced_density_matrix(state, 0, 2), np.array([[1, 0], [0, 0]]))
+    assert np.allclose(reduced_density_matrix(state, 1, 2), np.full((2, 2), 0.5))
+
+    # Bell state: each qubit on its own is maximally mixed
+    bell = np.array([1, 0, 0, 1]) / np.sqrt(2)
+    assert np.allclose(reduced_density_matrix(bell, 0, 2), np.eye(2) / 2)
+
+def test_qubit_indices():
+    # Negative indices count from the last qubit, as with list indexing, on both simulation methods
+    for method in ('statevector', 'tensornetwork'):
+        assert np.allclose(simulate_circuit(['0', '0'], [(-1, 'X')], method=method), np.array([0, 1, 0, 0]))
+        assert np.allclose(simulate_circuit(['0', '1'], [('CNOT', -1, 0)], method=method), np.array([0, 0, 0, 1]))
+        # Fusion sees -1 and 1 as the same qubit, so the CNOT on it still separates the two X gates
+        assert np.allclose(
+            simulate_circuit(['1', '0'], [(-1, 'X'), ('CNOT', 0, 1), (1, 'X')], method=method),
+            np.array([0, 0, 0, 1]),
+        )
+
+        # Out-of-range indices are rejected before any kernel touches the state
+        for gates_sequence in ([(2, 'X')], [(-3, 'X')], [('CNOT', 0, 2)], [('CNOT', -3, 0)], [('CNOT', -1, 1)]):
+            with pytest.raises(ValueError):
+                simulate_circuit(['0', '0'], gates_sequence, method=method)
 
-    qubits = [qubit_0, qubit_1]
-    probs = calculate_probabilities(qubits)
-    expected_probs = np.array([0.0, 0.0, 1.0, 0.0])  # For |01> the probabilities are [0, 0, 1, 0]
-    assert np.allclose(probs, expected_probs, atol=10) # TODO: Remove atol
+    state = np.array([1, 0, 0, 0], dtype=complex)
+    x = np.array([[0, 1], [1, 0]])
+    with pytest.raises(ValueError):
+        apply_1q(state, x, 2, 2)
+    with pytest.raises(ValueError):
+        apply_cnot(state, -1, 2, 2)
+    # The buffer size must match the number of qubits
+    with pytest.raises(ValueError):
+        apply_1q(np.zeros(8, dtype=complex), x, 0, 2)
+
+def test_fuse():
+    # Consecutive gates on one qubit become a single matrix (H then S is S @ H)
+    fused = fuse([(0, 'H'), (1, 'X'), (0, 'S')])
+    assert [op[0] for op in fused] == [0, 1]
+    s = np.array([[1, 0], [0, 1j]])
+    h = np.array([[1, 1], [1, -1]]) / np.sqrt(2)
+    assert np.allclose(fused[0][1], s @ h)
+
+    # A CNOT interrupts the runs on its own qubits only
+    fused = fuse([(0, 'H'), (2, 'X'), ('CNOT', 0, 1), (0, 'H'), (2, 'Z')])
+    assert [op[0] for op in fused] == [0, 'CNOT', 0, 2]
+
+    # Identical CNOTs back to back cancel, but not when a gate sits between them
+    assert fuse([('CNOT', 0, 1), ('CNOT', 0, 1)]) == []
+    assert len(fuse([('CNOT', 0, 1), (1, 'Z'), ('CNOT', 0, 1)])) == 3
+
+    with pytest.raises(ValueError):
+        fuse([(0, 'invalid')])
+
+def test_contract_circuit():
+    # Bell pair from |00>: H on qubit 0 then CNOT 0 -> 1
+    state = np.kron(create_qubit('0'), create_qubit('0'))
+    final_state = contract_circuit(state, fuse([(0, 'H'), ('CNOT', 0, 1)]), 2)
+    assert np.allclose(final_state, np.array([1, 0, 0, 1]) / np.sqrt(2))
+
+    # Same amplitudes as the gate-by-gate simulation, CNOTs in both directions included
+    gates_sequence = [(0, 'H'), (1, 'X'), ('CNOT', 0, 2), (2, 'T'), ('CNOT', 2, 1), (0, 'S'), ('CNOT', 1, 0)]
+    initial_states = ['+', '0', '-']
+    assert np.allclose(
+        simulate_circuit(initial_states, gates_sequence, method='tensornetwork'),
+        simulate_circuit(initial_states, gates_sequence),
+    )
+
+    # The contraction is cached per circuit shape, so different gates on the same wires still differ
+    state = np.kron(create_qubit('0'), create_qubit('0'))
+    assert np.allclose(contract_circuit(state, fuse([(0, 'X'), ('CNOT', 0, 1)]), 2), np.array([0, 0, 0, 1]))
+    assert np.allclose(contract_circuit(state, fuse([(0, 'Z'), ('CNOT', 0, 1)]), 2), np.array([1, 0, 0, 0]))
+
+    with pytest.raises(ValueError):
+        contract_circuit(state, [('CNOT', 0, 0)], 2)
+
+def test_kron_vectors():
+    zero, one, plus = create_qubit('0'), create_qubit('1'), create_qubit('+')
+    assert np.allclose(kron_vectors([zero, one, plus]), np.kron(np.kron(zero, one), plus))
+
+    # A single vector comes back as a copy, so the input is never modified through the result
+    state = kron_vectors([one])
+    state[0] = 1
+    assert np.array_equal(one, np.array([0, 1]))
 
-def test_simulate_circuit():
+    with pytest.raises(ValueError):
+        kron_vectors([])
+
+def test_simulate_circuit(capsys):
     initial_states = ['0', '1']
     gates_sequence = [(0, 'H'), ('CNOT', 0, 1)]
-    final_qubits = simulate_circuit(initial_states, gates_sequence)
+    final_state = simulate_circuit(initial_states, gates_sequence)
+
+    # Expected final state: the entangled state (|01> + |10>)/sqrt(2)
+    expected_state = np.array([0, 1 / np.sqrt(2), 1 / np.sqrt(2), 0])
+    assert np.allclose(final_state, expected_state)
 
-    # Expected final state: (|00> + |11>)/sqrt(2) for qubit 0 and |1> for qubit 1
-    expected_qubit_0 = np.array([1 / np.sqrt(2), 1 / np.sqrt(2)])
-    expected_qubit_1 = np.array([0, 1])
-    assert np.allclose(final_qubits[0], expected_qubit_0, atol=10) # TODO: Remove atol
-    assert np.allclose(final_qubits[1], expected_qubit_1, atol=10) # TODO: Remove atol
+    # Fusion does not change the result of a longer circuit
+    gates_sequence = [(0, 'H'), (0, 'T'), (1, 'H'), ('CNOT', 0, 2), ('CNOT', 0, 2), (2, 'S'), ('CNOT', 1, 2), (1, 'Z')]
+    state = np.kron(np.kron(create_qubit('+'), create_qubit('0')), create_qubit('1')).astype(complex)
+    for operation in gates_sequence:
+        if operation[0] == 'CNOT':
+            state = apply_cnot(state, operation[1], operation[2], 3)
+        else:
+            state = apply_1q(state, apply_gate(np.eye(2), operation[1]), operation[0], 3)
+    assert np.allclose(simulate_circuit(['+', '0', '1'], gates_sequence), state)
+
+    # Single precision by default, double precision on request, with no promotion along the way
+    assert simulate_circuit(['0', '1'], [(0, 'T'), ('CNOT', 0, 1)]).dtype == np.complex64
+    final_state = simulate_circuit(['0', '1'], [(0, 'H'), ('CNOT', 0, 1)], dtype=np.complex128)
+    assert final_state.dtype == np.complex128
+    assert np.allclose(final_state, expected_state, rtol=0, atol=1e-15)
+
+    # A single-qubit circuit returns its own writable vector, not the shared ket table entry
+    final_state = simulate_circuit(['1'], [])
+    final_state[0] = 1
+    assert np.array_equal(create_qubit('1'), np.array([0, 1]))
+
+    # Nothing is printed unless asked for
+    simulate_circuit(['0', '1'], [(0, 'H'), ('CNOT', 0, 1)])
+    assert capsys.readouterr().out == ""
+    simulate_circuit(['0', '1'], [(0, 'H'), ('CNOT', 0, 1)], verbose=True)
+    assert "CNOT" in capsys.readouterr().out
+
+    with pytest.raises(ValueError):
+        simulate_circuit(['0'], [(0, 'invalid')])
+    with pytest.raises(ValueError):
+        simulate_circuit(['0'], [], method='invalid')
 
 if __name__ == "__main__":
     pytest.main()